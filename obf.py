@@ -8,22 +8,106 @@ import random
 import builtins
 import argparse
 import marshal
+import functools
+import copy
+import types
+import unicodedata
+
+# Optional accelerated backends; both emit standard zlib/base64 streams
+try:
+    import pybase64 as _base64
+except ImportError:
+    _base64 = base64
+try:
+    from isal import isal_zlib as _zlib
+except ImportError:
+    _zlib = zlib
 
 # Obfuscator by Blank-C and Lawxsz
 
+# Every payload is decompressed exactly once at runtime, so favour speed
+# by default; higher levels trade obfuscation time for a smaller output
+_ZLIB_LEVEL = 1
+_ZLIB_MAX_LEVEL = getattr(_zlib, "ISAL_BEST_COMPRESSION", 9)
+
+_LOWERCASE_TABLE = bytes(ord(string.ascii_lowercase[b % 26]) for b in range(256))
+_LETTERS_TABLE = bytes(ord(string.ascii_letters[b % 52]) for b in range(256))
+
+_BUILTIN_NAMES = frozenset(dir(builtins))
+
+@functools.lru_cache(maxsize=1)
+def _get_valid_identifiers() -> str:
+    # One compact string instead of ~82k separate one-character objects.
+    # Identifiers are NFKC-normalized by the parser, so only keep characters
+    # that normalize to themselves; otherwise two aliases could be one name
+    return "".join([
+        c for c in map(chr, range(256, 0x24976))
+        if c.isidentifier() and unicodedata.normalize("NFKC", c) == c
+    ])
+
+@functools.lru_cache(maxsize=None)
+def _parse_layer(layer: str) -> ast.Module:
+    # Layer templates are constant; parse each of them once and copy per use
+    return ast.parse(layer)
+
+def _compress(data: bytes, level: int) -> bytes:
+    # isal only offers levels up to 3 on its own scale, so higher levels
+    # fall back to the stdlib to keep the zlib size/speed meaning
+    if level > _ZLIB_MAX_LEVEL:
+        return zlib.compress(data, level)
+    return _zlib.compress(data, level)
+
+def _deflate_b64(data: bytes, level: int) -> bytes:
+    return _base64.b64encode(_compress(data, level))
+
+def _deflate_b64_str(data: bytes, level: int) -> str:
+    # pybase64 can build the str directly, skipping the bytes -> str copy
+    if hasattr(_base64, "b64encode_as_string"):
+        return _base64.b64encode_as_string(_compress(data, level))
+    return _deflate_b64(data, level).decode("ascii")
+
+class _DocstringRemover(ast.NodeTransformer):
+    def _strip(self, node: ast.AST) -> ast.AST:
+        # Drop string statements outright so a module docstring cannot end up
+        # as a statement ahead of `from __future__` imports
+        node.body = [
+            n for n in node.body
+            if not (isinstance(n, ast.Expr) and isinstance(n.value, ast.Constant) and isinstance(n.value.value, str))
+        ]
+        if not node.body and not isinstance(node, ast.Module):
+            node.body = [ast.Pass()]
+        self.generic_visit(node)
+        return node
+
+    visit_Module = visit_FunctionDef = visit_AsyncFunctionDef = visit_ClassDef = _strip
+
+def _rename_names(tree: ast.AST, aliases: dict) -> ast.AST:
+    # Only Name ids change, so a flat walk is enough
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id in aliases:
+            node.id = aliases[node.id]
+    return tree
+
 class PyObfuscator:
-    def __init__(self, code: str, include_imports: bool = False, recursion: int = 1) -> None:
+    def __init__(self, code: str, include_imports: bool = False, recursion: int = 1, compression_level: int = _ZLIB_LEVEL, insert_junk: bool = True) -> None:
         self._code = code
+        self._tree = None
         self._imports = []
+        self._imported_names = frozenset()
         self._aliases = {}
-        self._valid_identifiers = [chr(i) for i in range(256, 0x24976) if chr(i).isidentifier()]
+        self._name_pool = iter(())
 
         # Options
         self.__include_imports = include_imports
+        self.__insert_junk = insert_junk
         if recursion < 1:
             raise ValueError("Recursion length cannot be less than 1")
         else:
             self.__recursion = recursion
+        if not 0 <= compression_level <= 9:
+            raise ValueError("Compression level must be between 0 and 9")
+        else:
+            self.__compression_level = compression_level
 
     def obfuscate(self) -> str:
         self._remove_comments_and_docstrings()
@@ -47,37 +131,22 @@ class PyObfuscator:
         for layer in layers:
             layer()
 
+        # Junk only matters in the final file; inside a layer it would just
+        # be compressed and fed through every later pass
+        if self.__insert_junk:
+            self._insert_dummy_comments()
         if self.__include_imports:
             self._prepend_imports()
         return self._code
 
     def _remove_comments_and_docstrings(self) -> None:
-        tree = ast.parse(self._code)
+        tree = _DocstringRemover().visit(self._get_tree())
         tree.body.insert(0, ast.Expr(
                     value=ast.Constant(":: prysmax is the best st3al3r ev3r ::")
                 ))
-        for index, node in enumerate(tree.body[1:]):
-
-            if isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant):
-                tree.body[index] = ast.Pass()
-
-            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
-                for i, expr in enumerate(node.body):
-                    if isinstance(expr, ast.Expr) and isinstance(expr.value, ast.Constant):
-                        node.body[i] = ast.Pass()
-
-            elif isinstance(node, ast.ClassDef):
-                for i, expr in enumerate(node.body):
-                    if isinstance(expr, ast.Expr) and isinstance(expr.value, ast.Constant):
-                        node.body[i] = ast.Pass()
-                    elif isinstance(expr, (ast.FunctionDef, ast.AsyncFunctionDef)):
-                        for j, n in enumerate(expr.body):
-                            if isinstance(n, ast.Expr) and isinstance(n.value, ast.Constant):
-                                expr.body[j] = ast.Pass()
-        self._code = ast.unparse(tree)
 
     def _save_imports(self) -> None:
-        def visit_node(node):
+        for node in ast.walk(self._get_tree()):
             if isinstance(node, ast.Import):
                 for name in node.names:
                     self._imports.append((None, name.name))
@@ -86,23 +155,21 @@ class PyObfuscator:
                 for name in node.names:
                     self._imports.append((module, name.name))
 
-            for child_node in ast.iter_child_nodes(node):
-                visit_node(child_node)
-
-        tree = ast.parse(self._code)
-        visit_node(tree)
+        self._imported_names = frozenset(x[1] for x in self._imports)
         self._imports.sort(reverse=True, key=lambda x: len(x[1]) + len(x[0]) if x[0] is not None else 0)
 
     def _prepend_imports(self) -> None:
-        for module, submodule in self._imports:
-            if module is not None:
-                statement = f"from {module} import {submodule}\n"
-            else:
-                statement = f"import {submodule}\n"
-            self._code = statement + self._code
+        # Plain imports sort last in self._imports, so emitting them before
+        # the from-imports keeps the statements in reverse order
+        imports = self._imports[::-1]
+        self._code = "".join((
+            "".join([f"import {submodule}\n" for module, submodule in imports if module is None]),
+            "".join([f"from {module} import {submodule}\n" for module, submodule in imports if module is not None]),
+            self._code
+        ))
 
     def _layer_1(self) -> None:
-        self._insert_dummy_comments()
+        self._commit_tree()
         layer = """
 fire = 'some_encoded_string_1'
 water = 'some_encoded_string_2'
@@ -112,83 +179,64 @@ wind = 'some_encoded_string_4'
 exec(__import__('zlib').decompress(__import__('base64').b64decode(fire + water + earth + wind)))
 """
         # Encode the code and split into parts
-        encoded = base64.b64encode(zlib.compress(self._code.encode())).decode()
-        parts = [encoded[i:i + len(encoded) // 4] for i in range(0, len(encoded), len(encoded) // 4)]
-        parts.reverse()
-
-        # Insert the parts into the layer code
-        tree = ast.parse(layer)
-        for node in ast.walk(tree):
-            if isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str) and parts:
-                before = "".join(random.choices(string.ascii_letters, k=random.randint(5, 100)))
-                after = "".join(random.choices(string.ascii_letters, k=random.randint(5, 100)))
-                part = parts.pop()
-                node.value = ast.Subscript(
-                    value=ast.Constant(value=before + part + after),
-                    slice=ast.Slice(
-                        upper=ast.Constant(value=len(before) + len(part)),
-                        lower=ast.Constant(value=len(before)),
-                        step=None
-                    ),
-                    ctx=ast.Store()
-                )
-        self._code = ast.unparse(tree)
-        self._obfuscate_vars()
-        self._insert_dummy_comments()
+        encoded = _deflate_b64_str(self._code.encode(), self.__compression_level)
+        # base64 output length is a multiple of 4, so the quarters are exact
+        quarter = len(encoded) // 4
+        parts = [encoded[i * quarter:(i + 1) * quarter] for i in range(4)]
+
+        # Pad each part with junk and slice it back out at runtime
+        payloads = {}
+        for index, part in enumerate(parts, 1):
+            before = random.randbytes(random.randint(5, 100)).translate(_LETTERS_TABLE).decode()
+            after = random.randbytes(random.randint(5, 100)).translate(_LETTERS_TABLE).decode()
+            payloads[f"some_encoded_string_{index}"] = f"{before + part + after!r}[{len(before)}:{len(before) + len(part)}]"
+        self._code = self._fill_layer(layer, payloads)
 
     def _layer_2(self) -> None:
         layer = """
-encrypted = []
+encrypted = 'encrypted_payload'
 for i in range(1, 100):
-    if encrypted[in_loc] ^ i == encrypted[re_loc]:
-        exec(__import__('zlib').decompress(bytes(map(lambda x: x ^ i, encrypted[:in_loc] + encrypted[in_loc+1:re_loc] + encrypted[re_loc+1:]))))
+    if encrypted['in_loc'] ^ i == encrypted['re_loc']:
+        table = bytes(b ^ i for b in range(256))
+        exec(__import__('zlib').decompress((encrypted[:'in_loc'] + encrypted['in_loc'+1:'re_loc'] + encrypted['re_loc'+1:]).translate(table)))
         break
 """
-        key = random.randint(1, 100)
-        in_byte = random.randbytes(1)[0]
+        self._commit_tree()
+        # The stub tries keys 1-99, so the key must stay inside that range
+        key = random.randint(1, 99)
+        in_byte = random.getrandbits(8)
         re_byte = in_byte ^ key
 
-        encrypted = list(map(lambda x: key ^ x, zlib.compress(self._code.encode())))
+        encrypted = bytearray(_compress(self._code.encode(), self.__compression_level).translate(bytes(b ^ key for b in range(256))))
 
-        in_loc = random.randint(0, int(len(encrypted)/2))
-        re_loc = random.randint(in_loc, len(encrypted) - 1)
+        # Both markers must land on distinct positions with in_loc first
+        in_loc = random.randint(0, len(encrypted) // 2)
         encrypted.insert(in_loc, in_byte)
+        re_loc = random.randint(in_loc + 1, len(encrypted))
         encrypted.insert(re_loc, re_byte)
-        layer = layer.replace("in_loc", str(in_loc)).replace("re_loc", str(re_loc))
-
-        tree = ast.parse(layer)
-        for node in ast.walk(tree):
-            if isinstance(node, ast.List):
-                node.elts = [ast.Constant(value=x) for x in encrypted]
 
-        self._code = ast.unparse(tree)
-        self._obfuscate_vars()
-        self._insert_dummy_comments()
+        self._code = self._fill_layer(layer, {
+            "in_loc": str(in_loc),
+            "re_loc": str(re_loc),
+            "encrypted_payload": repr(bytes(encrypted))
+        })
 
     def _layer_3(self) -> None:
         layer = """
-ip_table = []
-data = list([int(x) for item in [value.split(".") for value in ip_table] for x in item])
-exec(compile(__import__('zlib').decompress(__import__('base64').b64decode(bytes(data))), '<(*3*)>', 'exec'))
+ip_table = 'ip_addresses'
+data = bytes(map(int, '.'.join(ip_table).split('.')))
+exec(compile(__import__('zlib').decompress(__import__('base64').b64decode(data)), '<(*3*)>', 'exec'))
 """
         def bytes2ip(data: bytes) -> list:
-            ip_addresses = []
-            for index in range(0, len(data), 4):
-                ip_bytes = data[index:index+4]
-                ip_addresses.append(".".join([str(x) for x in ip_bytes]))
-            return ip_addresses
+            # base64 output is always a multiple of 4 bytes long, so the
+            # strided slices line up into whole addresses
+            return list(map("{}.{}.{}.{}".format, data[0::4], data[1::4], data[2::4], data[3::4]))
 
-        encrypted = base64.b64encode(zlib.compress(self._code.encode()))
+        self._commit_tree()
+        encrypted = _deflate_b64(self._code.encode(), self.__compression_level)
         ip_addresses = bytes2ip(encrypted)
 
-        self._code = layer
-        self._obfuscate_vars()
-        tree = ast.parse(self._code)
-        for node in ast.walk(tree):
-            if isinstance(node, ast.Assign) and isinstance(node.value, ast.List):
-                node.value.elts = [ast.Constant(value=x) for x in ip_addresses]
-        self._code = ast.unparse(tree)
-        self._insert_dummy_comments()
+        self._code = self._fill_layer(layer, {"ip_addresses": repr(ip_addresses)})
 
     def _layer_4(self) -> None:
         
@@ -198,79 +246,126 @@ import marshal
 exec(marshal.loads(__import__('zlib').decompress(__import__('base64').b64decode(b'encoded_code'))))
     """
         try:
-            marshaled_code = marshal.dumps(compile(self._code, "<string>", "exec"))
-            compressed_code = zlib.compress(marshaled_code)
-            encoded_code = base64.b64encode(compressed_code).decode()
+            # Compile a pending tree directly instead of unparsing it first
+            if self._tree is not None:
+                source, self._tree = ast.fix_missing_locations(self._tree), None
+            else:
+                source = self._code
+            compiled = compile(source, "<string>", "exec")
+            marshaled_code = marshal.dumps(compiled)
+            encoded_code = _deflate_b64_str(marshaled_code, self.__compression_level)
         except Exception as e:
             raise RuntimeError(f"Error during obfuscation in _layer_4: {e}")
 
+        if not isinstance(compiled, types.CodeType):
+            raise RuntimeError("Validation failed for layer 4: compile did not return a code object")
         self._code = layer.replace("encoded_code", encoded_code)
 
+        # The full round trip repeats the whole pipeline, so it is opt-in
+        if os.environ.get("PYOBFUSCATOR_VALIDATE") != "1":
+            return
         try:
             test_exec = marshal.loads(zlib.decompress(base64.b64decode(encoded_code)))
-            assert isinstance(test_exec, type(compile("", "", "exec")))
+            assert isinstance(test_exec, types.CodeType)
         except Exception as e:
             raise RuntimeError(f"Validation failed for layer 4: {e}")
 
-    def _obfuscate_vars(self) -> None:
-        class Transformer(ast.NodeTransformer):
-            def __init__(self, outer: PyObfuscator) -> None:
-                self._outer = outer
-
-            def rename(self, name: str) -> None:
-                if not name in dir(builtins) and not name in [x[1] for x in self._outer._imports]:
-                    return self._outer._generate_random_name(name)
-                else:
-                    return name
-
-            def visit_Name(self, node: ast.Name) -> ast.Name:
-                if node.id in self._outer._aliases:
-                    node.id = self._outer._aliases[node.id]
-                return node
+    def _get_tree(self) -> ast.Module:
+        # While self._tree is set it is the authoritative form of the code
+        if self._tree is None:
+            self._tree = ast.parse(self._code)
+        return self._tree
+
+    def _commit_tree(self) -> None:
+        if self._tree is not None:
+            self._code = ast.unparse(self._tree)
+            self._tree = None
+
+    def _fill_layer(self, layer: str, payloads: dict) -> str:
+        # Rename the small template on its own, then splice the payload
+        # literals into the text so they never go through ast.parse/unparse.
+        # Placeholders are replaced in order, so list large payloads last
+        code = ast.unparse(self._obfuscate_vars(copy.deepcopy(_parse_layer(layer))))
+        for placeholder, payload in payloads.items():
+            code = code.replace(repr(placeholder), payload)
+        return code
+
+    def _obfuscate_vars(self, tree: ast.AST) -> ast.AST:
+        # Give every eligible name an alias, then rewrite them in one walk
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name):
+                self._rename(node.id)
+        return _rename_names(tree, self._aliases)
 
-        tree = ast.parse(self._code)
-        transformer = Transformer(self)
-        tree = transformer.visit(tree)
-        self._code = ast.unparse(tree)
+    def _rename(self, name: str) -> str:
+        # Builtins and imported names must keep resolving, so never alias them
+        if name not in _BUILTIN_NAMES and name not in self._imported_names:
+            return self._generate_random_name(name)
+        return name
 
     def _generate_random_name(self, name: str) -> str:
         if name not in self._aliases:
-            random_name = random.choice(self._valid_identifiers)
+            try:
+                random_name = next(self._name_pool)
+            except StopIteration:
+                # Draw the next batch of distinct names in one call, sampling
+                # indices so the pool string is never split into a list, and
+                # skip any that are already taken so aliases never collide
+                ids = _get_valid_identifiers()
+                used = set(self._aliases.values())
+                indices = random.sample(range(len(ids)), min(len(ids), 4096 + len(used)))
+                self._name_pool = iter([ids[i] for i in indices if ids[i] not in used][:4096])
+                random_name = next(self._name_pool)
             self._aliases[name] = random_name
             return random_name
         return self._aliases[name]
 
     def _insert_dummy_comments(self) -> None:
-        self._code += "\n\n# #DECRYPT THIS\n#"
-        self._code += "#".join([
-    ''.join(list(dict.fromkeys(random.choices(string.ascii_lowercase, k=100))))[:50] * random.randint(1, 70) + "\n" 
-    for _ in range(1056)
-])
+        # Draw every random letter in one call and map the bytes onto a-z
+        width, count = len(string.ascii_lowercase), 1056
+        letters = random.randbytes(width * count).translate(_LOWERCASE_TABLE).decode()
+        repeats = random.choices(range(1, 71), k=count)
+        comments = "#".join([
+            letters[i * width:(i + 1) * width] * repeats[i] + "\n"
+            for i in range(count)
+        ])
+        self._code = "".join((self._code, "\n\n# #DECRYPT THIS\n#", comments))
 
 def main():
-    parser = argparse.ArgumentParser(description="Python Obfuscator")
-    parser.add_argument("input_file", help="Python source code file to obfuscate")
-    parser.add_argument("output_file", help="Output file for the obfuscated code")
+    parser = argparse.ArgumentParser(
+        description="Python Obfuscator",
+        epilog="Set PYOBFUSCATOR_VALIDATE=1 to decode and check every marshal layer after building it."
+    )
+    parser.add_argument("input_file", help="Python source code file to obfuscate ('-' for stdin)")
+    parser.add_argument("output_file", help="Output file for the obfuscated code ('-' for stdout)")
     parser.add_argument("--recursion", type=int, default=1, help="Number of recursions for obfuscation")
+    parser.add_argument("--compression-level", type=int, choices=range(10), default=_ZLIB_LEVEL, metavar="{0-9}", help="zlib level for the payloads; higher is smaller but slower")
     parser.add_argument("--include-imports", action="store_true", help="Include imports in obfuscation")
+    parser.add_argument("--no-junk", action="store_true", help="Do not append dummy comments to the output")
     args = parser.parse_args()
 
     try:
-        with open(args.input_file, "r") as f:
-            code = f.read()
+        if args.input_file == "-":
+            code = sys.stdin.read()
+        else:
+            with open(args.input_file, "r") as f:
+                code = f.read()
     except Exception as e:
-        print(f"Error reading input file: {e}")
+        print(f"Error reading input file: {e}", file=sys.stderr)
         sys.exit(1)
 
-    obfuscator = PyObfuscator(code, args.include_imports, args.recursion)
+    obfuscator = PyObfuscator(code, args.include_imports, args.recursion, args.compression_level, not args.no_junk)
     obfuscated_code = obfuscator.obfuscate()
 
     try:
-        with open(args.output_file, "w") as f:
-            f.write(obfuscated_code)
-        print(f"Obfuscated file saved to {args.output_file}")
+        if args.output_file == "-":
+            sys.stdout.write(obfuscated_code)
+        else:
+            with open(args.output_file, "w", encoding="utf-8") as f:
+                f.write(obfuscated_code)
+            print(f"Obfuscated file saved to {args.output_file}")
     except Exception as e:
-        print(f"Error saving output file: {e}")
+        print(f"Error saving output file: {e}", file=sys.stderr)
         sys.exit(1)
 
 